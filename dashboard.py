@@ -1,14 +1,22 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import plotly.express as px
 import os
 import plotly.graph_objects as go
-import json
+import plotly.io as pio
+import orjson
 from urllib.request import urlopen
 
 # ==============================================================================
 # CONFIGURAÇÃO INICIAL E CARREGAMENTO
 # ==============================================================================
+# O st.plotly_chart serializa cada figura com plotly.io.to_json; o orjson
+# (já usado para o GeoJSON) é bem mais rápido que o encoder padrão
+pio.json.config.default_engine = 'orjson'
+
 st.set_page_config(
     page_title="Dashboard Olist - Análise de Dados",
     layout="wide",
@@ -20,28 +28,129 @@ st.set_page_config(
 DATA_DIR = '.' 
 # Usamos o arquivo ZIP (versão leve)
 CAMINHO_DADOS = 'olist_lite.zip' 
+# Cópia já tipada em Parquet, gerada na primeira carga a partir do ZIP
+CAMINHO_PARQUET = 'olist_lite.parquet'
+# Versão do conteúdo gravado no Parquet: aumente ao mudar colunas, tipos ou
+# colunas derivadas, para que cópias antigas sejam descartadas
+VERSAO_PARQUET = 2
+# Chave, nos metadados do Parquet, com a identidade do ZIP que o gerou
+CHAVE_ORIGEM = b'olist_origem'
 CAMINHO_RELATORIO = 'relatorio_analise.txt'
-
-@st.cache_data
-def carregar_dados():
+URL_MAPA_BRASIL = "https://raw.githubusercontent.com/codeforamerica/click_that_hood/master/public/data/brazil-states.geojson"
+# Cópia local do GeoJSON, salva no primeiro download
+CAMINHO_MAPA = 'brazil-states.geojson'
+
+# Apenas as colunas usadas pelo painel, já com tipos compactos.
+# 'preco' continua float64 para não perder centavos no faturamento total;
+# 'review_score' é float porque há pedidos sem avaliação (NaN).
+COLUNAS_USADAS = [
+    'order_id', 'data_compra', 'tempo_total', 'preco', 'frete',
+    'estado_cliente', 'categoria', 'review_score', 'atraso_entrega', 'grupos'
+]
+TIPOS_COLUNAS = {
+    'estado_cliente': 'category',
+    'categoria': 'category',
+    'grupos': 'category',
+    'frete': 'float32',
+    'review_score': 'float32',
+    'tempo_total': 'int16',
+    'atraso_entrega': 'int16',
+}
+
+def substituir_arquivo(caminho, gravar):
+    # Grava em um temporário ao lado e só então troca pelo definitivo
+    # (os.replace é atômico): uma escrita interrompida (disco cheio, processo
+    # encerrado) nunca deixa um arquivo truncado no lugar do bom.
+    # A cópia é só um atalho: qualquer falha ao gravar (sem permissão, disco
+    # cheio, erro do Arrow) é ignorada e o painel segue sem ela
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    try:
+        gravar(temporario)
+        os.replace(temporario, caminho)
+    except Exception:
+        pass
+    finally:
+        # Depois do os.replace o temporário já não existe; numa falha, remove
+        # o que tiver sido gravado pela metade
+        if os.path.exists(temporario):
+            try:
+                os.remove(temporario)
+            except OSError:
+                pass
+
+# cache_resource devolve sempre o mesmo DataFrame (sem cópia a cada rerun);
+# por isso ele é tratado como somente leitura no resto do app. O arranque a
+# frio continua rápido graças ao Parquet gerado abaixo.
+# 'versao_dados' (mtime do ZIP) só entra na chave do cache: quando o arquivo
+# muda, o DataFrame é relido e agregados e gráficos, que usam a mesma chave,
+# são refeitos a partir dele. max_entries=1 descarta as versões antigas.
+@st.cache_resource(show_spinner="Carregando dados…", max_entries=1)
+def carregar_dados(versao_dados):
     # Verifica se o arquivo existe
     if not os.path.exists(CAMINHO_DADOS):
         st.error(f"ERRO CRÍTICO: O arquivo '{CAMINHO_DADOS}' não foi encontrado no GitHub. Verifique se você fez o upload do arquivo .zip corretamente.")
         return pd.DataFrame()
     
+    # O Parquet só é reaproveitado se foi gerado exatamente deste ZIP (mesmo
+    # mtime e tamanho) e com a versão atual do conteúdo. Comparar por
+    # igualdade, e não por "mais novo que", também pega um ZIP trocado por
+    # outro com data mais antiga (cp -p, rsync -t, arquivo extraído)
+    origem = orjson.dumps({
+        'versao_parquet': VERSAO_PARQUET,
+        'mtime_zip': versao_dados,
+        'tamanho_zip': os.path.getsize(CAMINHO_DADOS),
+    })
+    try:
+        # read_schema lê só o rodapé do arquivo
+        metadados = pq.read_schema(CAMINHO_PARQUET).metadata or {}
+        if metadados.get(CHAVE_ORIGEM) == origem:
+            # memory_map evita uma cópia do arquivo para a memória; split_blocks e
+            # self_destruct deixam o pandas reaproveitar os buffers do Arrow
+            tabela = pq.read_table(CAMINHO_PARQUET, memory_map=True)
+            return tabela.to_pandas(split_blocks=True, self_destruct=True)
+    except (OSError, pa.ArrowException):
+        # Parquet ausente ou ilegível: lê o ZIP de novo, o que também regrava a cópia
+        pass
+    
     try:
-        # compression='zip' permite ler o arquivo compactado diretamente
-        df = pd.read_csv(CAMINHO_DADOS, compression='zip')
+        # compression='zip' permite ler o arquivo compactado diretamente;
+        # o engine 'pyarrow' faz o parsing em C++ e em paralelo
+        df = pd.read_csv(
+            CAMINHO_DADOS,
+            compression='zip',
+            engine='pyarrow',
+            usecols=COLUNAS_USADAS,
+            dtype=TIPOS_COLUNAS,
+            # A data já sai como datetime do parser, sem um pd.to_datetime depois
+            parse_dates=['data_compra']
+        )
         
-        # Garantir que colunas de data sejam datetime
-        if 'data_compra' in df.columns:
-            df['data_compra'] = pd.to_datetime(df['data_compra'])
-            
-        return df
+        # Colunas derivadas da data ficam no cache junto com os dados.
+        # Mês via datetime64[M] do numpy (sem objetos Period) e formatado só
+        # para os meses distintos; 'category' guarda um código por linha
+        codigos_mes, meses = pd.factorize(df['data_compra'].to_numpy().astype('datetime64[M]'), sort=True)
+        df['mes_dt'] = pd.Categorical.from_codes(codigos_mes, meses.astype(str))
+
+        # O hash do pedido só serve para identificá-lo: 'codigo_pedido' guarda
+        # um código int32 por pedido no lugar dele, ocupa menos memória e deixa
+        # contagens distintas em numpy. O 'order_id' original sai do DataFrame
+        df['codigo_pedido'] = pd.factorize(df.pop('order_id'))[0].astype(np.int32)
     except Exception as e:
         st.error(f"Erro ao ler o arquivo de dados: {e}")
         return pd.DataFrame()
 
+    # Fora do try acima: uma falha ao gravar a cópia não pode esconder um
+    # CSV que foi lido corretamente
+    def gravar(caminho):
+        # Mesma conversão do df.to_parquet, com a identidade do ZIP somada
+        # aos metadados que o pandas já grava
+        tabela = pa.Table.from_pandas(df)
+        tabela = tabela.replace_schema_metadata({**tabela.schema.metadata, CHAVE_ORIGEM: origem})
+        pq.write_table(tabela, caminho, compression='zstd')
+
+    substituir_arquivo(CAMINHO_PARQUET, gravar)
+    return df
+
 @st.cache_data
 def carregar_relatorio():
     if os.path.exists(CAMINHO_RELATORIO):
@@ -49,8 +158,474 @@ def carregar_relatorio():
             return f.read()
     return "Relatório técnico não encontrado."
 
-# Carrega os dados
-df = carregar_dados()
+# cache_resource: o GeoJSON é baixado uma vez por processo e o mesmo objeto
+# é compartilhado entre as sessões (cache_data copiaria o dict a cada uso)
+@st.cache_resource(show_spinner=False)
+def carregar_mapa_brasil():
+    # Usa a cópia local; se ela não existir ou estiver ilegível, baixa de
+    # novo e a substitui
+    try:
+        with open(CAMINHO_MAPA, 'rb') as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        pass
+
+    try:
+        with urlopen(URL_MAPA_BRASIL, timeout=10) as response:
+            conteudo = response.read()
+        # Valida antes de salvar, para não deixar um arquivo corrompido em disco
+        mapa = orjson.loads(conteudo)
+    except (OSError, orjson.JSONDecodeError):
+        # Sem conexão (URLError é um OSError) ou resposta inválida
+        return None
+
+    def gravar(caminho):
+        with open(caminho, 'wb') as f:
+            f.write(conteudo)
+
+    substituir_arquivo(CAMINHO_MAPA, gravar)
+    return mapa
+
+def medias_por_codigo(codigos, valores, n_grupos):
+    # Média de cada coluna de 'valores' por código de grupo (0..n_grupos-1).
+    # np.bincount faz a soma de cada coluna em um único laço em C, sem a
+    # tabela hash do groupby; grupos sem linhas ficam com NaN.
+    validos = codigos >= 0
+    codigos, valores = codigos[validos], valores[validos]
+    contagem = np.bincount(codigos, minlength=n_grupos)
+    somas = np.column_stack([
+        np.bincount(codigos, weights=valores[:, j], minlength=n_grupos)
+        for j in range(valores.shape[1])
+    ])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return somas / contagem[:, None], contagem
+
+def normalizar_min_max(valores):
+    # Escala cada coluna de um array 2-D para o intervalo [0, 1]
+    minimo = valores.min(axis=0)
+    return (valores - minimo) / (valores.max(axis=0) - minimo)
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def calcular_agregados(versao_dados):
+    # Calcula uma única vez todas as tabelas resumidas usadas nas abas.
+    # 'versao_dados' (mtime do arquivo) é a chave do cache: barata de hashear
+    # e muda sempre que o arquivo de dados for atualizado.
+    df = carregar_dados(versao_dados)
+
+    # P1: Tempo e Região
+    # Cada linha é um item; para contar pedidos basta uma linha por pedido
+    # (mês e estado são os mesmos para todos os itens do pedido)
+    pedidos = df.drop_duplicates('codigo_pedido')
+    df_temporal = pedidos.groupby('mes_dt', observed=True).size().reset_index(name='order_id')
+    df_mapa = pedidos.groupby('estado_cliente', sort=False, observed=True).size().reset_index(name='order_id')
+    # Seleção parcial (nlargest) em vez de ordenar todos os estados; a ordem
+    # crescente coloca o líder no topo do gráfico horizontal
+    df_top10 = df_mapa.nlargest(10, 'order_id').iloc[::-1]
+
+    # P2: Preço e Categorias
+    # Ranking de volume por categoria contado uma vez: dá a categoria top (P2)
+    # e as 15 maiores da tabela de qualidade (P3)
+    ranking_categorias = df['categoria'].value_counts()
+    # Códigos inteiros da categoria (-1 = sem categoria), usados no P2 e no P3
+    cats = df['categoria'].cat
+    codigos_cat = cats.codes.to_numpy()
+    com_categoria = codigos_cat >= 0
+
+    # Um único groupby por categoria alimenta o Pareto e a dispersão
+    por_categoria = df.groupby('categoria', sort=False, observed=True).agg(
+        preco_medio=('preco', 'mean'),
+        faturamento=('preco', 'sum')
+    )
+    # Pedidos distintos por categoria sem o nunique do groupby: cada par
+    # (categoria, pedido) vira um int64, pd.unique remove os repetidos e o
+    # bincount conta quantos pares sobraram em cada categoria
+    n_pedidos = int(df['codigo_pedido'].max()) + 1
+    pares = pd.unique(
+        codigos_cat[com_categoria].astype(np.int64) * n_pedidos
+        + df['codigo_pedido'].to_numpy()[com_categoria]
+    )
+    pedidos_por_cat = np.bincount(pares // n_pedidos, minlength=len(cats.categories))
+    por_categoria.insert(
+        1, 'qtd_vendas', pedidos_por_cat[cats.categories.get_indexer(por_categoria.index)]
+    )
+
+    faturamento_cat = por_categoria['faturamento'].sort_values(ascending=False)
+    # % acumulado direto no array numpy (float32 basta para um percentual)
+    acumulado = np.cumsum(faturamento_cat.to_numpy(dtype=np.float32))
+    df_pareto = pd.DataFrame({
+        'categoria': faturamento_cat.index,
+        'preco': faturamento_cat.to_numpy(),
+        'percentual_acumulado': acumulado * (100.0 / acumulado[-1])
+    })
+
+    df_elasticidade = por_categoria.reset_index()
+    df_elasticidade = df_elasticidade[df_elasticidade['preco_medio'] < 2000]
+
+    # P3: Satisfação e Logística
+    # Contagem direta sobre o array numpy, sem materializar um DataFrame filtrado
+    qtd_atrasos = int(np.count_nonzero(df['atraso_entrega'].to_numpy() > 0))
+
+    # A nota é lida uma vez e serve ao histograma, às médias por dia e à
+    # composição por categoria: 'tem_nota' marca as linhas com avaliação e
+    # 'notas_validas' guarda a nota inteira (1 a 5) só dessas linhas
+    nota = df['review_score'].to_numpy()
+    tem_nota = ~np.isnan(nota)
+    notas_validas = nota[tem_nota].astype(np.int64)
+
+    # Notas são inteiros de 1 a 5: um bincount já entrega as cinco barras
+    # em ordem (sem o hash e a ordenação do value_counts)
+    df_notas = pd.DataFrame({
+        'Nota': np.arange(1, 6),
+        'Quantidade': np.bincount(notas_validas, minlength=6)[1:6]
+    })
+
+    # Média da nota por dia de entrega (até 50) via bincount: tempo_total já é
+    # um inteiro pequeno e serve de código; notas ausentes ficam de fora (-1)
+    dias = df['tempo_total'].to_numpy()
+    codigos_dia = np.where((dias <= 50) & tem_nota, dias, -1)
+    medias_dia, contagem_dia = medias_por_codigo(codigos_dia, nota[:, None], 51)
+    dias_com_nota = np.flatnonzero(contagem_dia)
+    df_corr = pd.DataFrame({
+        'tempo_total': dias_com_nota,
+        'review_score': medias_dia[dias_com_nota, 0]
+    })
+    # Reta de tendência (mínimos quadrados) ajustada uma vez sobre as médias diárias
+    tendencia_corr = np.polyfit(df_corr['tempo_total'], df_corr['review_score'], 1)
+
+    # Composição das notas (%) nas 15 maiores categorias: contagem de pares
+    # (categoria, nota) com np.bincount sobre os códigos inteiros, sem crosstab
+    # Linha da tabela para cada código de categoria (-1 = fora do top 15).
+    # A posição extra no fim atende o código -1 (sem categoria), que o numpy
+    # indexa como último elemento
+    top_cats = ranking_categorias.head(15).index.sort_values()
+    linha_por_codigo = np.full(len(cats.categories) + 1, -1)
+    linha_por_codigo[cats.categories.get_indexer(top_cats)] = np.arange(len(top_cats))
+
+    linhas = linha_por_codigo[codigos_cat[tem_nota]]
+    nas_top = linhas >= 0
+    contagem_notas = np.bincount(
+        linhas[nas_top] * 5 + notas_validas[nas_top] - 1, minlength=len(top_cats) * 5
+    ).reshape(len(top_cats), 5)
+
+    df_qualidade = pd.DataFrame(
+        contagem_notas / contagem_notas.sum(axis=1, keepdims=True) * 100,
+        columns=[1, 2, 3, 4, 5]
+    )
+    df_qualidade.insert(0, 'categoria', top_cats.astype(str))
+
+    # P4: Clusters
+    cols_grupos = ['preco', 'tempo_total', 'frete']
+    grupos = df['grupos'].cat
+    medias, contagem = medias_por_codigo(
+        grupos.codes.to_numpy(),
+        df[cols_grupos].to_numpy(dtype=np.float64),
+        len(grupos.categories)
+    )
+    df_stats_grupos = pd.DataFrame(
+        medias, index=pd.Index(grupos.categories, name='grupos'), columns=cols_grupos
+    )[contagem > 0]
+
+    # Versão formatada para exibição, montada uma vez junto com o cache
+    tabela_grupos = pd.DataFrame({
+        'Cluster (Perfil)': df_stats_grupos.index,
+        'Ticket Médio': df_stats_grupos['preco'].map('R$ {:.2f}'.format).to_numpy(),
+        'Tempo Médio': df_stats_grupos['tempo_total'].map('{:.1f} dias'.format).to_numpy(),
+        'Frete Médio': df_stats_grupos['frete'].map('R$ {:.2f}'.format).to_numpy(),
+    })
+
+    return {
+        'tempo_medio': df['tempo_total'].mean(),
+        'temporal': df_temporal,
+        'mapa': df_mapa,
+        'top10_estados': df_top10,
+        'ticket_medio': df['preco'].mean(),
+        'categoria_top': ranking_categorias.index[0],
+        'total_faturado': df['preco'].sum(),
+        'pareto': df_pareto,
+        'elasticidade': df_elasticidade,
+        'nota_media': df['review_score'].mean(),
+        'qtd_atrasos': qtd_atrasos,
+        'perc_atrasos': qtd_atrasos / len(df) * 100,
+        'notas': df_notas,
+        'correlacao': df_corr,
+        'tendencia_corr': tendencia_corr,
+        'qualidade': df_qualidade,
+        'stats_grupos': df_stats_grupos,
+        'tabela_grupos': tabela_grupos,
+    }
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def amostrar_dados(versao_dados, n, seed=42):
+    # Amostra fixa para os gráficos de dispersão: sorteada uma única vez,
+    # fica estável entre as interações e não embaralha o DataFrame a cada rerun
+    df = carregar_dados(versao_dados)
+    return df.sample(n=min(n, df.shape[0]), random_state=seed)
+
+# ==============================================================================
+# GRÁFICOS
+# ==============================================================================
+# Cada figura é montada uma vez por versão dos dados e guardada com
+# cache_resource (o mesmo objeto é reaproveitado entre reruns e sessões),
+# evitando refazer o layout do Plotly a cada interação. Só a versão atual
+# fica guardada (max_entries=1).
+
+# Gráficos apenas de leitura (gauge, lollipop, sunburst, histograma) vão
+# estáticos: o Plotly não registra hover, zoom nem barra de ferramentas.
+# Dispersões e mapa continuam interativos.
+CONFIG_ESTATICO = {'staticPlot': True, 'displayModeBar': False}
+
+# GAUGE CHART (Velocímetro)
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_gauge(versao_dados):
+    tempo_medio = calcular_agregados(versao_dados)['tempo_medio']
+
+    fig_gauge = go.Figure(go.Indicator(
+        mode = "gauge+number",
+        value = tempo_medio,
+        title = {'text': "Tempo Médio (Dias)"},
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        gauge = {
+            'axis': {'range': [0, 30], 'tickwidth': 1, 'tickcolor': "#17202A"},
+            'bar': {'color': "#154360"},
+            'bgcolor': "white",
+            'borderwidth': 2,
+            'bordercolor': "gray",
+            'steps': [
+                {'range': [0, 10], 'color': "#2ECC71"},
+                {'range': [10, 18], 'color': "#F1C40F"},
+                {'range': [18, 30], 'color': "#E74C3C"}
+            ],
+        }
+    ))
+    fig_gauge.update_layout(height=300, margin=dict(l=20, r=20, t=50, b=20))
+    return fig_gauge
+
+# AREA CHART
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_area(versao_dados):
+    df_temporal = calcular_agregados(versao_dados)['temporal']
+
+    fig_area = px.area(
+        df_temporal, 
+        x='mes_dt', 
+        y='order_id',
+        title="Evolução do Volume de Pedidos",
+        labels={'mes_dt': 'Mês', 'order_id': 'Pedidos'},
+        template="plotly_white"
+    )
+    fig_area.update_traces(line_color='#0E6251', fillcolor='rgba(14, 98, 81, 0.3)')
+    return fig_area
+
+# CHOROPLETH MAP (None quando o GeoJSON não pôde ser carregado)
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_mapa(versao_dados):
+    brazil_geo = carregar_mapa_brasil()
+    if not brazil_geo:
+        return None
+
+    df_mapa = calcular_agregados(versao_dados)['mapa']
+
+    fig_map = px.choropleth(
+        df_mapa,
+        geojson=brazil_geo,
+        locations='estado_cliente',
+        featureidkey='properties.sigla',
+        color='order_id',
+        color_continuous_scale='Blues',
+        title="Intensidade de Vendas por Estado",
+        template="plotly_white"
+    )
+    fig_map.update_geos(fitbounds="locations", visible=False)
+    fig_map.update_layout(height=500, margin={"r":0,"t":30,"l":0,"b":0})
+    return fig_map
+
+# LOLLIPOP CHART
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_lollipop(versao_dados):
+    df_top10 = calcular_agregados(versao_dados)['top10_estados']
+
+    # Hastes: um único trace de linhas, segmentos (0 -> valor) separados por
+    # um ponto vazio, em vez de um add_shape por estado
+    n_estados = len(df_top10)
+    estados = df_top10['estado_cliente'].astype(str).to_numpy()
+    x_hastes = np.full(3 * n_estados, np.nan)
+    x_hastes[0::3] = 0
+    x_hastes[1::3] = df_top10['order_id'].to_numpy()
+    y_hastes = np.full(3 * n_estados, None, dtype=object)
+    y_hastes[0::3] = estados
+    y_hastes[1::3] = estados
+
+    fig_lolly = go.Figure()
+    fig_lolly.add_trace(go.Scatter(
+        x=x_hastes,
+        y=y_hastes,
+        mode='lines',
+        line=dict(color='gray', width=1),
+        hoverinfo='skip',
+        showlegend=False
+    ))
+    fig_lolly.add_trace(go.Scatter(
+        x=df_top10['order_id'],
+        y=df_top10['estado_cliente'],
+        mode='markers',
+        marker=dict(color='#D35400', size=12),
+        showlegend=False
+    ))
+
+    fig_lolly.update_layout(
+        title="Estados Líderes em Vendas",
+        xaxis_title="Quantidade de Pedidos",
+        template="plotly_white",
+        height=500
+    )
+    return fig_lolly
+
+# PARETO
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_pareto(versao_dados):
+    df_pareto_top = calcular_agregados(versao_dados)['pareto'].head(20)
+
+    fig_pareto = go.Figure()
+    fig_pareto.add_trace(go.Bar(
+        x=df_pareto_top['categoria'], y=df_pareto_top['preco'],
+        name='Faturamento (R$)', marker_color='#154360'
+    ))
+    fig_pareto.add_trace(go.Scatter(
+        x=df_pareto_top['categoria'], y=df_pareto_top['percentual_acumulado'],
+        name='% Acumulado', yaxis='y2', mode='lines+markers', marker=dict(color='#D35400')
+    ))
+
+    fig_pareto.update_layout(
+        title="Top 20 Categorias: Faturamento vs. Acumulado",
+        yaxis=dict(title="Faturamento (R$)"),
+        yaxis2=dict(title="% Acumulado", overlaying='y', side='right', range=[0, 110]),
+        template="plotly_white", legend=dict(x=0.5, y=1.1, orientation='h')
+    )
+    return fig_pareto
+
+# SCATTER
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_elasticidade(versao_dados):
+    df_elasticidade = calcular_agregados(versao_dados)['elasticidade']
+
+    fig_scatter = px.scatter(
+        df_elasticidade, x='preco_medio', y='qtd_vendas',
+        size='faturamento', color='qtd_vendas', hover_name='categoria',
+        title="Produtos mais caros vendem menos?",
+        labels={'preco_medio': 'Preço Médio (R$)', 'qtd_vendas': 'Qtd. Vendas'},
+        template="plotly_white", color_continuous_scale='Viridis'
+    )
+    return fig_scatter
+
+# SUNBURST
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_sunburst(versao_dados):
+    df_sun = calcular_agregados(versao_dados)['pareto'].head(15)
+
+    fig_sun = px.sunburst(
+        df_sun, path=['categoria'], values='preco',
+        title="Share de Faturamento (Top 15)",
+        color_discrete_sequence=px.colors.qualitative.Prism
+    )
+    return fig_sun
+
+# HISTOGRAMA DAS NOTAS
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_notas(versao_dados):
+    df_notas = calcular_agregados(versao_dados)['notas']
+
+    cores_notas = {1: '#E74C3C', 2: '#E67E22', 3: '#F1C40F', 4: '#3498DB', 5: '#2ECC71'}
+
+    fig_hist = px.bar(
+        df_notas, x='Nota', y='Quantidade', text_auto=True,
+        title="Histograma de Avaliações", template="plotly_white"
+    )
+    fig_hist.update_traces(marker_color=[cores_notas.get(n, '#333') for n in df_notas['Nota']])
+    fig_hist.update_layout(xaxis=dict(tickmode='linear'))
+    return fig_hist
+
+# LINHA: TEMPO DE ENTREGA x NOTA
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_correlacao(versao_dados):
+    agregados = calcular_agregados(versao_dados)
+    df_corr = agregados['correlacao']
+
+    fig_corr = px.line(
+        df_corr, x='tempo_total', y='review_score', markers=True,
+        title="Correlação: Tempo de Entrega x Nota Média",
+        labels={'tempo_total': 'Dias para Entregar', 'review_score': 'Nota Média'},
+        template="plotly_white"
+    )
+    inclinacao, intercepto = agregados['tendencia_corr']
+    x_tend = np.array([df_corr['tempo_total'].min(), df_corr['tempo_total'].max()])
+    fig_corr.add_scatter(
+        x=x_tend, y=inclinacao * x_tend + intercepto,
+        mode='lines', line=dict(color='red', width=2, dash='dot'), name='Tendência'
+    )
+    return fig_corr
+
+# BARRAS EMPILHADAS: COMPOSIÇÃO DAS NOTAS POR CATEGORIA
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_qualidade(versao_dados):
+    df_qualidade = calcular_agregados(versao_dados)['qualidade']
+
+    fig_stack = px.bar(
+        df_qualidade, x=[1, 2, 3, 4, 5], y='categoria', orientation='h',
+        title="Composição das Notas por Categoria (%)",
+        labels={'value': '% do Total', 'categoria': 'Categoria', 'variable': 'Nota'},
+        template="plotly_white",
+        color_discrete_map={1: '#E74C3C', 2: '#E67E22', 3: '#F1C40F', 4: '#3498DB', 5: '#2ECC71'}
+    )
+    fig_stack.update_layout(barmode='stack', legend_title_text='Nota ⭐')
+    return fig_stack
+
+# DISPERSÃO DOS CLUSTERS
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_clusters(versao_dados):
+    df_sample = amostrar_dados(versao_dados, 5000)
+
+    # ATENÇÃO: Usando coluna 'grupos' conforme seu arquivo processado
+    fig_cluster = px.scatter(
+        df_sample, x='tempo_total', y='preco', 
+        color='grupos', symbol='grupos',
+        title="Dispersão dos Pedidos Identificados pelo K-Means",
+        labels={'tempo_total': 'Dias de Entrega', 'preco': 'Valor do Pedido (R$)'},
+        template="plotly_white",
+        color_discrete_sequence=px.colors.qualitative.Set1,
+        height=500,
+        # Só fixa o que o 'auto' do Plotly já escolhe acima de 1000 pontos
+        # (scattergl), para não depender do tamanho da amostra
+        render_mode='webgl'
+    )
+    fig_cluster.update_layout(xaxis_range=[0, 60], yaxis_range=[0, 1000])
+    return fig_cluster
+
+# RADAR DOS CLUSTERS
+@st.cache_resource(show_spinner=False, max_entries=1)
+def grafico_radar(versao_dados):
+    # Médias por 'grupos' (pré-calculadas)
+    df_medias = calcular_agregados(versao_dados)['stats_grupos']
+
+    # Uma linha normalizada (preço, tempo, frete) por grupo, direto do numpy:
+    # sem iterrows e com todos os traços passados de uma vez para a figura
+    medias_norm = normalizar_min_max(df_medias[['preco', 'tempo_total', 'frete']].to_numpy())
+    categorias = ['Preço', 'Tempo de Entrega', 'Frete']
+
+    fig_radar = go.Figure([
+        go.Scatterpolar(r=r, theta=categorias, fill='toself', name=nome)
+        for nome, r in zip(df_medias.index, medias_norm)
+    ])
+
+    fig_radar.update_layout(
+        polar=dict(radialaxis=dict(visible=True, range=[0, 1])),
+        showlegend=True, height=400, template="plotly_white"
+    )
+    return fig_radar
+
+# Carrega os dados. A versão (mtime do ZIP) é a chave de todos os caches;
+# sem o arquivo, carregar_dados mostra o erro e devolve um DataFrame vazio
+versao_dados = os.path.getmtime(CAMINHO_DADOS) if os.path.exists(CAMINHO_DADOS) else None
+df = carregar_dados(versao_dados)
 
 # ==============================================================================
 # BARRA LATERAL (SIDEBAR)
@@ -64,6 +639,8 @@ if not df.empty:
     )
     
     # Botão de Download do Relatório
+    # É o único widget do painel; com on_click='ignore' o download não
+    # dispara um rerun do script inteiro (as abas não têm o que recalcular)
     st.sidebar.markdown("---")
     relatorio_conteudo = carregar_relatorio()
     st.sidebar.download_button(
@@ -71,6 +648,7 @@ if not df.empty:
         data=relatorio_conteudo,
         file_name='relatorio_analise_completo.txt',
         mime='text/plain',
+        on_click='ignore',
         help="Baixe o relatório com as tabelas estatísticas, correlações e clusters."
     )
 
@@ -99,71 +677,25 @@ tab_p1, tab_p2, tab_p3, tab_ml = st.tabs([
 if df.empty:
     st.stop()
 
+# Tabelas resumidas (calculadas uma vez e reaproveitadas a cada interação)
+agregados = calcular_agregados(versao_dados)
+
 # ==============================================================================
 # ABA 1: PERGUNTA 1 (Tempo e Região)
 # ==============================================================================
 with tab_p1:
     st.markdown("### 📊 P1: Monitoramento Temporal e Geográfico")
-    
-    # --- PREPARAÇÃO DO MAPA (GEOJSON) ---
-    @st.cache_data
-    def carregar_mapa_brasil():
-        url = "https://raw.githubusercontent.com/codeforamerica/click_that_hood/master/public/data/brazil-states.geojson"
-        try:
-            with urlopen(url) as response:
-                return json.load(response)
-        except:
-            return None
-
-    brazil_geo = carregar_mapa_brasil()
 
     # --- LINHA 1: INDICADORES E TENDÊNCIA ---
     col_kpi, col_area = st.columns([1, 2])
     
     with col_kpi:
         st.subheader("⏱️ Eficiência Logística")
-        
-        # GAUGE CHART (Velocímetro)
-        tempo_medio = df['tempo_total'].mean()
-        
-        fig_gauge = go.Figure(go.Indicator(
-            mode = "gauge+number",
-            value = tempo_medio,
-            title = {'text': "Tempo Médio (Dias)"},
-            domain = {'x': [0, 1], 'y': [0, 1]},
-            gauge = {
-                'axis': {'range': [0, 30], 'tickwidth': 1, 'tickcolor': "#17202A"},
-                'bar': {'color': "#154360"},
-                'bgcolor': "white",
-                'borderwidth': 2,
-                'bordercolor': "gray",
-                'steps': [
-                    {'range': [0, 10], 'color': "#2ECC71"},
-                    {'range': [10, 18], 'color': "#F1C40F"},
-                    {'range': [18, 30], 'color': "#E74C3C"}
-                ],
-            }
-        ))
-        fig_gauge.update_layout(height=300, margin=dict(l=20, r=20, t=50, b=20))
-        st.plotly_chart(fig_gauge, use_container_width=True)
+        st.plotly_chart(grafico_gauge(versao_dados), use_container_width=True, config=CONFIG_ESTATICO)
 
     with col_area:
         st.subheader("📈 Tendência de Vendas (Acumulado)")
-        
-        # AREA CHART
-        df['mes_dt'] = df['data_compra'].dt.to_period('M').astype(str)
-        df_temporal = df.groupby('mes_dt')['order_id'].nunique().reset_index()
-        
-        fig_area = px.area(
-            df_temporal, 
-            x='mes_dt', 
-            y='order_id',
-            title="Evolução do Volume de Pedidos",
-            labels={'mes_dt': 'Mês', 'order_id': 'Pedidos'},
-            template="plotly_white"
-        )
-        fig_area.update_traces(line_color='#0E6251', fillcolor='rgba(14, 98, 81, 0.3)')
-        st.plotly_chart(fig_area, use_container_width=True)
+        st.plotly_chart(grafico_area(versao_dados), use_container_width=True)
 
     st.markdown("---")
 
@@ -173,55 +705,15 @@ with tab_p1:
     with col_mapa:
         st.subheader("🇧🇷 Mapa de Calor de Vendas (Brasil)")
         
-        # CHOROPLETH MAP
-        df_mapa = df.groupby('estado_cliente')['order_id'].nunique().reset_index()
-        
-        if brazil_geo:
-            fig_map = px.choropleth(
-                df_mapa,
-                geojson=brazil_geo,
-                locations='estado_cliente',
-                featureidkey='properties.sigla',
-                color='order_id',
-                color_continuous_scale='Blues',
-                title="Intensidade de Vendas por Estado",
-                template="plotly_white"
-            )
-            fig_map.update_geos(fitbounds="locations", visible=False)
-            fig_map.update_layout(height=500, margin={"r":0,"t":30,"l":0,"b":0})
+        fig_map = grafico_mapa(versao_dados)
+        if fig_map is not None:
             st.plotly_chart(fig_map, use_container_width=True)
         else:
             st.warning("Não foi possível carregar o mapa. Verifique sua conexão.")
 
     with col_rank:
         st.subheader("🏆 Top 10 Estados")
-        
-        # LOLLIPOP CHART
-        df_top10 = df_mapa.sort_values(by='order_id', ascending=True).tail(10)
-        
-        fig_lolly = go.Figure()
-        fig_lolly.add_trace(go.Scatter(
-            x=df_top10['order_id'],
-            y=df_top10['estado_cliente'],
-            mode='markers',
-            marker=dict(color='#D35400', size=12)
-        ))
-        
-        for i in range(len(df_top10)):
-            fig_lolly.add_shape(
-                type='line',
-                x0=0, y0=df_top10['estado_cliente'].iloc[i],
-                x1=df_top10['order_id'].iloc[i], y1=df_top10['estado_cliente'].iloc[i],
-                line=dict(color='gray', width=1)
-            )
-
-        fig_lolly.update_layout(
-            title="Estados Líderes em Vendas",
-            xaxis_title="Quantidade de Pedidos",
-            template="plotly_white",
-            height=500
-        )
-        st.plotly_chart(fig_lolly, use_container_width=True)
+        st.plotly_chart(grafico_lollipop(versao_dados), use_container_width=True, config=CONFIG_ESTATICO)
 
 # ==============================================================================
 # ABA 2: PERGUNTA 2 (Preço e Categorias)
@@ -230,9 +722,9 @@ with tab_p2:
     st.markdown("### 🏷️ P2: Análise de Preço e Mix de Produtos")
     
     col1, col2, col3 = st.columns(3)
-    ticket_medio = df['preco'].mean()
-    categoria_top = df['categoria'].mode()[0]
-    total_faturado = df['preco'].sum()
+    ticket_medio = agregados['ticket_medio']
+    categoria_top = agregados['categoria_top']
+    total_faturado = agregados['total_faturado']
     
     col1.metric("Ticket Médio", f"R$ {ticket_medio:.2f}")
     col2.metric("Categoria Top (Volume)", categoria_top)
@@ -241,33 +733,7 @@ with tab_p2:
     st.markdown("---")
 
     st.subheader("📊 Curva ABC (Pareto) de Faturamento")
-    
-    # PARETO
-    df_pareto = df.groupby('categoria')['preco'].sum().reset_index()
-    df_pareto = df_pareto.sort_values(by='preco', ascending=False)
-    
-    df_pareto['acumulado'] = df_pareto['preco'].cumsum()
-    df_pareto['percentual_acumulado'] = (df_pareto['acumulado'] / df_pareto['preco'].sum()) * 100
-    
-    df_pareto_top = df_pareto.head(20)
-    
-    fig_pareto = go.Figure()
-    fig_pareto.add_trace(go.Bar(
-        x=df_pareto_top['categoria'], y=df_pareto_top['preco'],
-        name='Faturamento (R$)', marker_color='#154360'
-    ))
-    fig_pareto.add_trace(go.Scatter(
-        x=df_pareto_top['categoria'], y=df_pareto_top['percentual_acumulado'],
-        name='% Acumulado', yaxis='y2', mode='lines+markers', marker=dict(color='#D35400')
-    ))
-    
-    fig_pareto.update_layout(
-        title="Top 20 Categorias: Faturamento vs. Acumulado",
-        yaxis=dict(title="Faturamento (R$)"),
-        yaxis2=dict(title="% Acumulado", overlaying='y', side='right', range=[0, 110]),
-        template="plotly_white", legend=dict(x=0.5, y=1.1, orientation='h')
-    )
-    st.plotly_chart(fig_pareto, use_container_width=True)
+    st.plotly_chart(grafico_pareto(versao_dados), use_container_width=True)
     
     st.markdown("---")
     
@@ -275,36 +741,11 @@ with tab_p2:
     
     with col_scatter:
         st.subheader("📉 Relação Preço vs. Volume")
-        
-        # SCATTER
-        df_elasticidade = df.groupby('categoria').agg(
-            preco_medio=('preco', 'mean'),
-            qtd_vendas=('order_id', 'nunique'),
-            faturamento=('preco', 'sum')
-        ).reset_index()
-        
-        df_elasticidade = df_elasticidade[df_elasticidade['preco_medio'] < 2000]
-        
-        fig_scatter = px.scatter(
-            df_elasticidade, x='preco_medio', y='qtd_vendas',
-            size='faturamento', color='qtd_vendas', hover_name='categoria',
-            title="Produtos mais caros vendem menos?",
-            labels={'preco_medio': 'Preço Médio (R$)', 'qtd_vendas': 'Qtd. Vendas'},
-            template="plotly_white", color_continuous_scale='Viridis'
-        )
-        st.plotly_chart(fig_scatter, use_container_width=True)
+        st.plotly_chart(grafico_elasticidade(versao_dados), use_container_width=True)
 
     with col_sun:
         st.subheader("☀️ Sunburst de Categorias")
-        
-        # SUNBURST
-        df_sun = df_pareto.head(15)
-        fig_sun = px.sunburst(
-            df_sun, path=['categoria'], values='preco',
-            title="Share de Faturamento (Top 15)",
-            color_discrete_sequence=px.colors.qualitative.Prism
-        )
-        st.plotly_chart(fig_sun, use_container_width=True)
+        st.plotly_chart(grafico_sunburst(versao_dados), use_container_width=True, config=CONFIG_ESTATICO)
 
 # ==============================================================================
 # ABA 3: PERGUNTA 3 (Satisfação)
@@ -313,9 +754,9 @@ with tab_p3:
     st.markdown("### ⭐ P3: Impacto da Logística na Satisfação")
     
     col1, col2, col3 = st.columns(3)
-    avg_score = df['review_score'].mean()
-    qtd_atrasos = df[df['atraso_entrega'] > 0].shape[0]
-    perc_atrasos = (qtd_atrasos / df.shape[0]) * 100
+    avg_score = agregados['nota_media']
+    qtd_atrasos = agregados['qtd_atrasos']
+    perc_atrasos = agregados['perc_atrasos']
     
     col1.metric("Nota Média (1-5)", f"{avg_score:.2f} ⭐")
     col2.metric("Pedidos com Atraso", f"{qtd_atrasos:,}".replace(',', '.'))
@@ -327,57 +768,16 @@ with tab_p3:
     
     with col_hist:
         st.subheader("📊 Distribuição das Notas")
-        
-        df_notas = df['review_score'].value_counts().reset_index()
-        df_notas.columns = ['Nota', 'Quantidade']
-        df_notas = df_notas.sort_values('Nota')
-        
-        cores_notas = {1: '#E74C3C', 2: '#E67E22', 3: '#F1C40F', 4: '#3498DB', 5: '#2ECC71'}
-        
-        fig_hist = px.bar(
-            df_notas, x='Nota', y='Quantidade', text_auto=True,
-            title="Histograma de Avaliações", template="plotly_white"
-        )
-        fig_hist.update_traces(marker_color=[cores_notas.get(n, '#333') for n in df_notas['Nota']])
-        fig_hist.update_layout(xaxis=dict(tickmode='linear'))
-        st.plotly_chart(fig_hist, use_container_width=True)
+        st.plotly_chart(grafico_notas(versao_dados), use_container_width=True, config=CONFIG_ESTATICO)
 
     with col_corr:
         st.subheader("📉 Atraso vs. Satisfação")
-        
-        df_corr = df[df['tempo_total'] <= 50].groupby('tempo_total')['review_score'].mean().reset_index()
-        
-        fig_corr = px.line(
-            df_corr, x='tempo_total', y='review_score', markers=True,
-            title="Correlação: Tempo de Entrega x Nota Média",
-            labels={'tempo_total': 'Dias para Entregar', 'review_score': 'Nota Média'},
-            template="plotly_white"
-        )
-        fig_corr.add_scatter(
-            x=df_corr['tempo_total'], y=df_corr['review_score'], 
-            mode='lines', line=dict(color='red', width=2, dash='dot'), name='Tendência'
-        )
-        st.plotly_chart(fig_corr, use_container_width=True)
+        st.plotly_chart(grafico_correlacao(versao_dados), use_container_width=True)
 
     st.markdown("---")
 
     st.subheader("🏆 Qualidade Percebida por Categoria (Top 15)")
-    
-    top_cats = df['categoria'].value_counts().head(15).index
-    df_top_cats = df[df['categoria'].isin(top_cats)]
-    
-    df_qualidade = pd.crosstab(df_top_cats['categoria'], df_top_cats['review_score'], normalize='index') * 100
-    df_qualidade = df_qualidade.reset_index()
-    
-    fig_stack = px.bar(
-        df_qualidade, x=[1, 2, 3, 4, 5], y='categoria', orientation='h',
-        title="Composição das Notas por Categoria (%)",
-        labels={'value': '% do Total', 'categoria': 'Categoria', 'variable': 'Nota'},
-        template="plotly_white",
-        color_discrete_map={1: '#E74C3C', 2: '#E67E22', 3: '#F1C40F', 4: '#3498DB', 5: '#2ECC71'}
-    )
-    fig_stack.update_layout(barmode='stack', legend_title_text='Nota ⭐')
-    st.plotly_chart(fig_stack, use_container_width=True)
+    st.plotly_chart(grafico_qualidade(versao_dados), use_container_width=True)
 
 # ==============================================================================
 # ABA 4: MACHINE LEARNING (Clusterização)
@@ -388,21 +788,7 @@ with tab_ml:
 
     # --- LINHA 1: VISÃO ESPACIAL (SCATTER) ---
     st.subheader("📍 Mapa dos Clusters (Preço vs. Tempo)")
-    
-    df_sample = df.sample(n=min(5000, df.shape[0]), random_state=42)
-    
-    # ATENÇÃO: Usando coluna 'grupos' conforme seu arquivo processado
-    fig_cluster = px.scatter(
-        df_sample, x='tempo_total', y='preco', 
-        color='grupos', symbol='grupos',
-        title="Dispersão dos Pedidos Identificados pelo K-Means",
-        labels={'tempo_total': 'Dias de Entrega', 'preco': 'Valor do Pedido (R$)'},
-        template="plotly_white",
-        color_discrete_sequence=px.colors.qualitative.Set1,
-        height=500
-    )
-    fig_cluster.update_layout(xaxis_range=[0, 60], yaxis_range=[0, 1000])
-    st.plotly_chart(fig_cluster, use_container_width=True)
+    st.plotly_chart(grafico_clusters(versao_dados), use_container_width=True)
 
     st.markdown("---")
 
@@ -411,43 +797,17 @@ with tab_ml:
 
     with col_radar:
         st.subheader("🕸️ Personalidade dos Clusters (Radar)")
-        
-        # Agrupando por 'grupos'
-        df_medias = df.groupby('grupos')[['preco', 'tempo_total', 'frete']].mean()
-        
-        df_norm = (df_medias - df_medias.min()) / (df_medias.max() - df_medias.min())
-        df_norm = df_norm.reset_index()
-        
-        fig_radar = go.Figure()
-        categorias = ['Preço', 'Tempo de Entrega', 'Frete']
-        
-        for i, row in df_norm.iterrows():
-            fig_radar.add_trace(go.Scatterpolar(
-                r=[row['preco'], row['tempo_total'], row['frete']],
-                theta=categorias, fill='toself', name=row['grupos']
-            ))
-
-        fig_radar.update_layout(
-            polar=dict(radialaxis=dict(visible=True, range=[0, 1])),
-            showlegend=True, height=400, template="plotly_white"
-        )
-        st.plotly_chart(fig_radar, use_container_width=True)
+        st.plotly_chart(grafico_radar(versao_dados), use_container_width=True)
 
     with col_stat:
         st.subheader("📝 Estatísticas Reais por Grupo")
         
-        # Cálculo nos dados brutos
-        df_stats = df.groupby('grupos')[['preco', 'tempo_total', 'frete']].mean()
+        # Médias calculadas nos dados brutos (mesma tabela usada no radar)
+        df_stats = agregados['stats_grupos']
         
         # Grupo Rico (Maior preço)
         grupo_rico = df_stats['preco'].idxmax()
         
-        # Formatação
-        tabela_visual = df_stats.reset_index()
-        tabela_visual.columns = ['Cluster (Perfil)', 'Ticket Médio', 'Tempo Médio', 'Frete Médio']
-        tabela_visual['Ticket Médio'] = tabela_visual['Ticket Médio'].apply(lambda x: f"R$ {x:.2f}")
-        tabela_visual['Tempo Médio'] = tabela_visual['Tempo Médio'].apply(lambda x: f"{x:.1f} dias")
-        tabela_visual['Frete Médio'] = tabela_visual['Frete Médio'].apply(lambda x: f"R$ {x:.2f}")
-        
-        st.table(tabela_visual)
+        # Tabela já formatada no cache de agregados
+        st.table(agregados['tabela_grupos'])
         st.success(f"💡 Insight: O grupo **{grupo_rico}** é o que traz maior receita unitária.")